@@ -1,2 +1,3 @@
 from ._monthly_report import MonthlyReport, find_monthly_reports
+from ._paths import parse_monthly_report_path
 from ._payment import Receipt, ReceiptItem
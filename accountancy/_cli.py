@@ -0,0 +1,47 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import logging
+import pathlib
+import sys
+from typing import Iterator, Optional, TextIO
+
+
+def create_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.WARNING)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler()
+        handler.formatter = logging.Formatter(
+                fmt='%(name)s:%(levelname)s:%(message)s')
+        logger.addHandler(handler)
+    return logger
+
+
+def build_common_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    # verbose
+    parser.add_argument(
+            '-v', '--verbose',
+            action='store_true',
+            help='set log level to debug')
+    # output
+    parser.add_argument(
+            '-o', '--output',
+            type=pathlib.Path,
+            help='output file (default stdout)')
+    return parser
+
+
+@contextlib.contextmanager
+def open_output(
+        path: Optional[pathlib.Path] = None) -> Iterator[TextIO]:
+    output = (
+            path.open(mode='w', encoding='utf-8', buffering=1 << 16)
+            if path is not None
+            else sys.stdout)
+    try:
+        yield output
+    finally:
+        if path is not None:
+            output.close()
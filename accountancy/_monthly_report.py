@@ -1,12 +1,18 @@
 from __future__ import annotations
-import dataclasses
 import logging
+import os
 import pathlib
 import re
-from typing import Literal, Optional
+from typing import Callable, Literal, NamedTuple, Optional
+from ._paths import parse_monthly_report_path
 from ._payment import Receipt, parse_payment
 
 
+_TITLE_RE = re.compile(r'^# (?P<title>.+)')
+_YYYY_RE = re.compile(r'[0-9]{4}')
+_MM_MD_RE = re.compile(r'(0[1-9]|1[0-2])\.md')
+
+
 class MonthlyReport:
     def __init__(
             self,
@@ -16,36 +22,35 @@ class MonthlyReport:
         self._year = year
         self._month = month
         self._lines = lines
+        self._payment: Optional[list[Receipt]] = None
 
     @classmethod
     def load(
             cls,
             filepath: pathlib.Path,
             *,
+            year: Optional[int] = None,
+            month: Optional[int] = None,
             logger: Optional[logging.Logger] = None,
     ) -> Optional[MonthlyReport]:
         filepath = filepath.resolve()
         logger = logger or logging.getLogger(__name__)
         logger.info(f'load "{filepath.as_posix()}"')
-        # validate filepath
-        filepath_match = re.search(
-                r'(?P<year>[0-9]{4})/(?P<month>0[1-9]|1[0-2])\.md$',
-                filepath.as_posix())
-        if not filepath_match:
-            logger.error(f'{filepath.as_posix()} is not YYYY/MM.md')
-            return None
-        # year, month
-        year = int(filepath_match.group('year'))
-        month = int(filepath_match.group('month'))
+        # year, month (parsed from the filepath unless already known)
+        if year is None or month is None:
+            # validate filepath
+            year_month = parse_monthly_report_path(filepath)
+            if year_month is None:
+                logger.error(f'{filepath.as_posix()} is not YYYY/MM.md')
+                return None
+            year, month = year_month
         logger.debug(f'year={year}, month={month}')
         # load file
         logger.debug(f'open "{filepath.as_posix()}"')
-        lines: list[MonthlyReportLine] = []
         with filepath.open(encoding='utf-8') as file:
-            for i, line in enumerate(file, start=1):
-                lines.append(MonthlyReportLine(
-                        text=line.removesuffix('\n'),
-                        line_number=i))
+            lines = [
+                    MonthlyReportLine(line.removesuffix('\n'), i)
+                    for i, line in enumerate(file, start=1)]
         # generate
         report = cls(year, month, lines)
         # validate title
@@ -66,29 +71,47 @@ class MonthlyReport:
         return self._month
 
     def text(self) -> str:
-        return ''.join(f'{line.text}\n' for line in self._lines)
+        if not self._lines:
+            return ''
+        return '\n'.join([line.text for line in self._lines]) + '\n'
 
     def title(self) -> Optional[str]:
         if self._lines:
-            if title_match := re.match(
-                    r'^# (?P<title>.+)',
-                    self._lines[0].text):
+            if title_match := _TITLE_RE.match(self._lines[0].text):
                 return title_match.group('title')
         return None
 
     def payment(
             self,
             *,
-            logger: Optional[logging.Logger] = None) -> list[Receipt]:
-        return parse_payment(
-                self.year,
-                self.month,
-                self._lines,
-                logger=logger)
-
-
-@dataclasses.dataclass(frozen=True)
-class MonthlyReportLine:
+            logger: Optional[logging.Logger] = None,
+            store_filter: Optional[Callable[[str], bool]] = None,
+    ) -> list[Receipt]:
+        # only the unfiltered result is cached; a call with store_filter
+        # reuses it when available, otherwise it parses (and logs) again.
+        # a call served from the cache ignores its logger: the parse
+        # warnings went to the logger of the first unfiltered call
+        if self._payment is None:
+            if store_filter is not None:
+                return parse_payment(
+                        self.year,
+                        self.month,
+                        self._lines,
+                        logger=logger,
+                        store_filter=store_filter)
+            self._payment = parse_payment(
+                    self.year,
+                    self.month,
+                    self._lines,
+                    logger=logger)
+        if store_filter is not None:
+            return [
+                    receipt for receipt in self._payment
+                    if store_filter(receipt.store)]
+        return list(self._payment)
+
+
+class MonthlyReportLine(NamedTuple):
     text: str
     line_number: int
 
@@ -102,7 +125,7 @@ def find_monthly_reports(
     reports: list[MonthlyReport] = []
     # auto mode
     if mode == 'auto':
-        if re.match(r'[0-9]{4}', directory.name):
+        if _YYYY_RE.match(directory.name):
             mode = 'months'
         else:
             mode = 'years'
@@ -125,11 +148,14 @@ def _find_monthly_reports_years(
         logger.warning(f'the path "{directory.as_posix()}" is not a directory')
         return reports
     # find YYYY
-    for child in directory.iterdir():
-        if not child.is_dir():
-            continue
-        if re.match(r'[0-9]{4}', child.name):
-            reports.extend(_find_monthly_reports_months(child, logger))
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if _YYYY_RE.match(entry.name):
+                reports.extend(_find_monthly_reports_months(
+                        pathlib.Path(entry.path),
+                        logger))
     return reports
 
 
@@ -142,14 +168,26 @@ def _find_monthly_reports_months(
         logger.warning(f'the path "{directory.as_posix()}" is not a directory')
         return reports
     # check directory name
-    if not re.match(r'[0-9]{4}', directory.name):
+    if not _YYYY_RE.match(directory.name):
         logger.warning(f'the directory name "{directory.stem}" is not YYYY')
+    # year & month are passed to load() when the names are exactly YYYY/MM.md
+    year: Optional[int] = None
+    if _YYYY_RE.fullmatch(directory.name):
+        year = int(directory.name)
     # find MM.md
-    for child in directory.iterdir():
-        if not child.is_file():
-            continue
-        if re.match(r'(0[1-9]|1[0-2])\.md', child.name):
-            report = MonthlyReport.load(child, logger=logger)
-            if report is not None:
-                reports.append(report)
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if _MM_MD_RE.match(entry.name):
+                month: Optional[int] = None
+                if _MM_MD_RE.fullmatch(entry.name):
+                    month = int(entry.name.removesuffix('.md'))
+                report = MonthlyReport.load(
+                        pathlib.Path(entry.path),
+                        year=year,
+                        month=month,
+                        logger=logger)
+                if report is not None:
+                    reports.append(report)
     return reports
@@ -0,0 +1,17 @@
+from __future__ import annotations
+import pathlib
+import re
+from typing import Optional
+
+
+_YYYY_MM_MD_RE = re.compile(
+        r'(?:^|/)(?P<year>[0-9]{4})/(?P<month>0[1-9]|1[0-2])\.md$')
+
+
+def parse_monthly_report_path(
+        path: pathlib.Path) -> Optional[tuple[int, int]]:
+    # .../YYYY/MM.md -> (year, month)
+    path_match = _YYYY_MM_MD_RE.search(path.as_posix())
+    if path_match is None:
+        return None
+    return int(path_match.group('year')), int(path_match.group('month'))
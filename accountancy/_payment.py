@@ -1,13 +1,32 @@
 from __future__ import annotations
 import dataclasses
 import datetime
+import functools
 import logging
+import operator
 import re
-from typing import TYPE_CHECKING, Final, Generator, Literal, Optional
+from typing import TYPE_CHECKING, Callable, Final, Literal, Optional
 if TYPE_CHECKING:
     from ._monthly_report import MonthlyReportLine
 
 
+_ROW_RE = re.compile(
+        r'('
+        r'\|(?P<day>[0-9]+)'
+        r'\|(?P<hour>[0-9]{2}):(?P<minute>[0-9]{2})'
+        r'\|(?P<store>[^\|]+)'
+        r'|'
+        r'\|{3}'
+        r')'
+        r'('
+        r'\|(?P<item>[^\|]+)'
+        r'\|(?P<price>-?[0-9]+)'
+        r'\|'
+        r'|'
+        r'\|{3}'
+        r')')
+
+
 @dataclasses.dataclass(frozen=True)
 class ReceiptItem:
     name: str
@@ -27,7 +46,7 @@ class Receipt:
     items: list[ReceiptItem] = dataclasses.field(compare=False)
     line_number: int
 
-    @property
+    @functools.cached_property
     def datetime(self) -> datetime.datetime:
         return datetime.datetime(
                 year=self.year,
@@ -36,22 +55,31 @@ class Receipt:
                 hour=self.hour,
                 minute=self.minute)
 
+    @functools.cached_property
+    def _row_prefix(self) -> str:
+        return f'|{self.day}|{self.hour:02}:{self.minute:02}|{self.store}'
+
     @property
     def last_line_number(self) -> int:
         return self.line_number + len(self.items) - 1
 
     def to_table_rows(self) -> list[str]:
-        rows: list[str] = []
-        for item in self.items:
-            if rows:
-                rows.append(f'||||{item.name}|{item.price}|')
-            else:
-                rows.append(
-                        f'|{self.day}'
-                        f'|{self.hour:02}:{self.minute:02}'
-                        f'|{self.store}'
-                        f'|{item.name}|{item.price}|')
-        return rows
+        if not self.items:
+            return []
+        return [
+                self.to_first_row(),
+                *(f'||||{item.name}|{item.price}|'
+                  for item in self.items[1:])]
+
+    def to_first_row(self) -> str:
+        item = self.items[0]
+        return f'{self._row_prefix}|{item.name}|{item.price}|'
+
+    def to_last_row(self) -> str:
+        if len(self.items) == 1:
+            return self.to_first_row()
+        item = self.items[-1]
+        return f'||||{item.name}|{item.price}|'
 
     def to_table(self) -> str:
         return '\n'.join(self.to_table_rows())
@@ -62,18 +90,25 @@ def parse_payment(
         month: int,
         lines: list[MonthlyReportLine],
         *,
-        logger: Optional[logging.Logger]) -> list[Receipt]:
+        logger: Optional[logging.Logger],
+        store_filter: Optional[Callable[[str], bool]] = None,
+) -> list[Receipt]:
     logger = logger or logging.getLogger(__name__)
 
     receipts: list[Receipt] = []
     tables = _parse_payment_table(lines, logger)
     for table in tables:
-        parser = _PaymentTableParser(year, month, logger)
+        parser = _PaymentTableParser(
+                year,
+                month,
+                logger,
+                store_filter=store_filter)
         for row in table:
             parser.push(row)
         receipts.extend(parser.result())
     # sort by old...new
-    receipts.sort()
+    receipts.sort(key=operator.attrgetter(
+            'year', 'month', 'day', 'hour', 'minute', 'line_number'))
     return receipts
 
 
@@ -105,76 +140,112 @@ class _TableRow:
         logger.debug(
                 f'parse as {cls.__name__}'
                 f' "{line.text}" at line {line.line_number}')
-        # split
-        row_match = re.match(
-                r'('
-                r'\|(?P<day>[0-9]+)'
-                r'\|(?P<hour>[0-9]{2}):(?P<minute>[0-9]{2})'
-                r'\|(?P<store>[^\|]+)'
-                r'|'
-                r'\|{3}'
-                r')'
-                r'('
-                r'\|(?P<item>[^\|]+)'
-                r'\|(?P<price>-?[0-9]+)'
-                r'\|'
-                r'|'
-                r'\|{3}'
-                r')',
-                line.text)
-        if row_match is None:
+        # split (every table row starts with '|')
+        columns = (
+                _split_row(line) or _match_row(line)
+                if line.text.startswith('|')
+                else None)
+        if columns is None:
             logger.error(
                     'failed to parse'
                     f' "{line.text}" at line {line.line_number}')
             return None
-        # key
-        key: Optional[_TableKey] = None
-        if row_match.group('day') is not None:
-            key = _TableKey(
-                    day=int(row_match.group('day')),
-                    hour=int(row_match.group('hour')),
-                    minute=int(row_match.group('minute')),
-                    store=row_match.group('store'),
-                    line_number=line.line_number)
-        # item
-        item: Optional[ReceiptItem] = None
-        if row_match.group('item') is not None:
-            item = ReceiptItem(
-                    name=row_match.group('item'),
-                    price=int(row_match.group('price')),
-                    line_number=line.line_number)
+        key, item = columns
         # row
         row = cls(key=key, item=item, line_number=line.line_number)
         logger.debug(f'row: {row}')
         return row
 
 
-def _filter_payment_section(
-        lines: list[MonthlyReportLine]
-) -> Generator[MonthlyReportLine, None, None]:
-    in_section = False
-    for line in lines:
-        # the line is not in payment section
-        if not in_section:
-            if re.match(r'## 出費', line.text):
-                in_section = True
-        # the line is in paylemnt section
-        else:
-            if line.text.startswith('#'):
-                in_section = False
-                return
-            yield line
+def _split_row(
+        line: MonthlyReportLine
+) -> Optional[tuple[Optional[_TableKey], Optional[ReceiptItem]]]:
+    # |day|HH:MM|store|item|price| or ||||item|price| or |day|HH:MM|store|||
+    columns = line.text.split('|')
+    if len(columns) != 7 or columns[0] or columns[6]:
+        return None
+    _, day, time, store, name, price, _ = columns
+    # key
+    key: Optional[_TableKey] = None
+    if day or time or store:
+        hhmm = _parse_hhmm(time)
+        if not (_is_digits(day) and hhmm is not None and store):
+            return None
+        key = _TableKey(
+                day=int(day),
+                hour=hhmm[0],
+                minute=hhmm[1],
+                store=store,
+                line_number=line.line_number)
+    # item
+    item: Optional[ReceiptItem] = None
+    if name or price:
+        if not (name and _is_digits(price.removeprefix('-'))):
+            return None
+        item = ReceiptItem(
+                name=name,
+                price=int(price),
+                line_number=line.line_number)
+    return key, item
+
+
+def _match_row(
+        line: MonthlyReportLine
+) -> Optional[tuple[Optional[_TableKey], Optional[ReceiptItem]]]:
+    row_match = _ROW_RE.match(line.text)
+    if row_match is None:
+        return None
+    # key
+    key: Optional[_TableKey] = None
+    if row_match.group('day') is not None:
+        key = _TableKey(
+                day=int(row_match.group('day')),
+                hour=int(row_match.group('hour')),
+                minute=int(row_match.group('minute')),
+                store=row_match.group('store'),
+                line_number=line.line_number)
+    # item
+    item: Optional[ReceiptItem] = None
+    if row_match.group('item') is not None:
+        item = ReceiptItem(
+                name=row_match.group('item'),
+                price=int(row_match.group('price')),
+                line_number=line.line_number)
+    return key, item
+
+
+def _parse_hhmm(text: str) -> Optional[tuple[int, int]]:
+    if len(text) != 5 or text[2] != ':':
+        return None
+    hour, minute = text[:2], text[3:]
+    if not (_is_digits(hour) and _is_digits(minute)):
+        return None
+    return int(hour), int(minute)
+
+
+def _is_digits(text: str) -> bool:
+    # str.isdigit accepts non-ASCII digits, which [0-9] does not
+    return text.isascii() and text.isdigit()
 
 
 def _parse_payment_table(
         lines: list[MonthlyReportLine],
         logger: logging.Logger) -> list[list[_TableRow]]:
+    # pylint: disable=too-many-branches
     header: Final[str] = '|日|時刻|店|商品|価格|'
     alignment: Final[str] = '|--:|--:|:--|:--|--:|'
-    state: Literal['header', 'body', 'outer'] = 'outer'
+    state: Literal['pre_section', 'header', 'body', 'outer'] = 'pre_section'
     tables: list[list[_TableRow]] = []
     table: list[_TableRow] = []
-    for line in _filter_payment_section(lines):
+    for line in lines:
+        # the line is not in payment section
+        if state == 'pre_section':
+            if line.text.startswith('## 出費'):
+                state = 'outer'
+            continue
+        # the end of payment section
+        if line.text.startswith('#'):
+            break
         logger.debug(f'({state}) "{line.text}" at {line.line_number}')
         match state:
             case 'body':
@@ -205,15 +276,21 @@ class _PaymentTableParser:
             self,
             year: int,
             month: int,
-            logger: logging.Logger) -> None:
+            logger: logging.Logger,
+            *,
+            store_filter: Optional[Callable[[str], bool]] = None) -> None:
         self._year = year
         self._month = month
         self._logger = logger
+        self._store_filter = store_filter
         # item
         self._receipts: list[Receipt] = []
         # table
         self._is_last_empty = False
         self._is_before_key_empty = False
+        self._is_skipped = False
+        self._is_last_skipped = False
+        self._last_key: Optional[_TableKey] = None
         self._table_key: Optional[_TableKey] = None
         self._table_items: list[ReceiptItem] = []
 
@@ -223,7 +300,7 @@ class _PaymentTableParser:
             if self._is_last_empty:
                 self._logger.warning(
                         'consective empty row at '
-                        f'{self._year:04}/{self._month:02}.md'
+                        f'{_report_name(self._year, self._month)}'
                         f':{row.line_number}')
             self._push_receipt()
             self._is_last_empty = True
@@ -234,8 +311,12 @@ class _PaymentTableParser:
             # set temporary key
             self._is_before_key_empty = self._is_last_empty
             self._table_key = row.key
+            # receipts rejected by the store filter are not built
+            self._is_skipped = (
+                    self._store_filter is not None
+                    and not self._store_filter(row.key.store))
         # item
-        if row.item is not None:
+        if row.item is not None and not self._is_skipped:
             # set item
             self._table_items.append(row.item)
         # is not empty row
@@ -244,28 +325,47 @@ class _PaymentTableParser:
     def result(self) -> list[Receipt]:
         self._push_receipt()
         # empty row
-        if not self._is_last_empty:
+        if (not self._is_last_empty
+                and not self._is_last_skipped
+                and self._receipts):
             self._logger.warning(
                     'need an empty row after: '
                     f'{_last_position_message(self._receipts[-1])}')
         return self._receipts
 
     def _push_receipt(self) -> None:
-        if self._table_key is None:
+        key = self._table_key
+        if key is None:
+            return
+        items = self._table_items
+        # reset temporary key & items
+        self._table_key = None
+        self._table_items = []
+        # skipped receipt: only its position is kept for the validation
+        self._is_last_skipped = self._is_skipped
+        if self._is_skipped:
+            self._is_skipped = False
+            try:
+                datetime.datetime(
+                        year=self._year,
+                        month=self._month,
+                        day=key.day,
+                        hour=key.hour,
+                        minute=key.minute)
+            except ValueError:
+                return
+            self._last_key = key
             return
         receipt = Receipt(
                 year=self._year,
                 month=self._month,
-                day=self._table_key.day,
-                hour=self._table_key.hour,
-                minute=self._table_key.minute,
-                store=self._table_key.store,
-                items=self._table_items,
-                line_number=self._table_key.line_number)
+                day=key.day,
+                hour=key.hour,
+                minute=key.minute,
+                store=key.store,
+                items=items,
+                line_number=key.line_number)
         self._logger.debug(f'new receipt: {receipt}')
-        # reset temporary key & items
-        self._table_key = None
-        self._table_items = []
         # validate datetime
         try:
             receipt.datetime
@@ -274,13 +374,15 @@ class _PaymentTableParser:
                     f'invalid datetime: {_first_position_message(receipt)}')
             return
         # validate order
-        if self._receipts:
-            if self._receipts[-1].datetime > receipt.datetime:
+        last = self._last_key
+        if last is not None:
+            if ((last.day, last.hour, last.minute)
+                    > (receipt.day, receipt.hour, receipt.minute)):
                 self._logger.warning(
                         f'wrong order: {_first_position_message(receipt)}')
         # validate empty row
-        if self._receipts:
-            if self._receipts[-1].datetime.day < receipt.datetime.day:
+        if last is not None:
+            if last.day < receipt.day:
                 if not self._is_before_key_empty:
                     self._logger.warning(
                             'need an empty row before: '
@@ -297,16 +399,22 @@ class _PaymentTableParser:
                         'need an empty row before: '
                         f'{_first_position_message(receipt)}')
         # add to receipts
+        self._last_key = key
         self._receipts.append(receipt)
 
 
 def _first_position_message(receipt: Receipt) -> str:
-    return (f'{receipt.to_table_rows()[0]} '
-            f'at {receipt.year:04}/{receipt.month:02}.md'
+    return (f'{receipt.to_first_row()} '
+            f'at {_report_name(receipt.year, receipt.month)}'
             f':{receipt.line_number}')
 
 
 def _last_position_message(receipt: Receipt) -> str:
-    return (f'{receipt.to_table_rows()[-1]} '
-            f'at {receipt.year:04}/{receipt.month:02}.md'
+    return (f'{receipt.to_last_row()} '
+            f'at {_report_name(receipt.year, receipt.month)}'
             f':{receipt.last_line_number}')
+
+
+@functools.cache
+def _report_name(year: int, month: int) -> str:
+    return f'{year:04}/{month:02}.md'
@@ -2,19 +2,21 @@
 
 from __future__ import annotations
 import argparse
-import contextlib
 import dataclasses
 import datetime
 import logging
 import pathlib
-import sys
-from typing import Iterator, Optional, TextIO
 import accountancy
+from accountancy._cli import build_common_parser, create_logger, open_output
+
+
+_EXCLUDE_EXACT = frozenset({'コイン利用', '消費税', 'クーポン割引'})
+_EXCLUDE_PREFIX = ('期間限定コイン', 'BOOK☆WALKER コイン')
 
 
 def main() -> None:
     # logger
-    logger = create_logger()
+    logger = create_logger(__name__)
     # option
     option = argument_parser().parse_args()
     if option.verbose:
@@ -26,13 +28,12 @@ def main() -> None:
     # receipts
     receipts: list[accountancy.Receipt] = []
     for report in reports:
-        receipts.extend(report.payment(logger=logger))
+        receipts.extend(report.payment(
+                logger=logger,
+                store_filter=lambda store: store == 'BOOK☆WALKER'))
     # books
     books: list[Book] = []
     for receipt in receipts:
-        # filter by store
-        if receipt.store != 'BOOK☆WALKER':
-            continue
         # items
         for item in receipt.items:
             # filter by item name
@@ -46,13 +47,15 @@ def main() -> None:
     # sort by title
     books.sort()
     # output
+    lines = [
+            f'{book.title}\t'
+            f'{book.purchase_time.year:04}'
+            f'/{book.purchase_time.month:02}'
+            f'/{book.purchase_time.day:02}\t'
+            f'{book.line_number}\n'
+            for book in books]
     with open_output(option.output) as output:
-        for book in books:
-            purchase_date = book.purchase_time.strftime('%Y/%m/%d')
-            output.write(
-                    f'{book.title}\t'
-                    f'{purchase_date}\t'
-                    f'{book.line_number}\n')
+        output.writelines(lines)
 
 
 @dataclasses.dataclass(frozen=True, order=True)
@@ -64,26 +67,12 @@ class Book:
 
 
 def is_book(item: accountancy.ReceiptItem) -> bool:
-    return (item.name != 'コイン利用'
-            and item.name != '消費税'
-            and item.name != 'クーポン割引'
-            and not item.name.startswith('期間限定コイン')
-            and not item.name.startswith('BOOK☆WALKER コイン'))
-
-
-def create_logger() -> logging.Logger:
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.WARNING)
-    if not logger.hasHandlers():
-        handler = logging.StreamHandler()
-        handler.formatter = logging.Formatter(
-                fmt='%(name)s:%(levelname)s:%(message)s')
-        logger.addHandler(handler)
-    return logger
+    return (item.name not in _EXCLUDE_EXACT
+            and not item.name.startswith(_EXCLUDE_PREFIX))
 
 
 def argument_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser()
+    parser = build_common_parser()
     # target
     parser.add_argument(
             '--target',
@@ -91,32 +80,8 @@ def argument_parser() -> argparse.ArgumentParser:
             type=pathlib.Path,
             default=pathlib.Path(),
             help='target directory')
-    # verbose
-    parser.add_argument(
-            '-v', '--verbose',
-            action='store_true',
-            help='set log level to debug')
-    # output
-    parser.add_argument(
-            '-o', '--output',
-            type=pathlib.Path,
-            help='output file (default stdout)')
     return parser
 
 
-@contextlib.contextmanager
-def open_output(
-        path: Optional[pathlib.Path] = None) -> Iterator[TextIO]:
-    output = (
-            path.open(mode='w', encoding='utf-8')
-            if path is not None
-            else sys.stdout)
-    try:
-        yield output
-    finally:
-        if path is not None:
-            output.close()
-
-
 if __name__ == '__main__':
     main()
@@ -2,19 +2,26 @@
 
 from __future__ import annotations
 import argparse
-import contextlib
+import csv
 import dataclasses
 import datetime
+import functools
+import io
 import logging
 import pathlib
 import re
-import sys
-from typing import Iterator, Optional, TextIO
+import stat
+from typing import Optional
+import accountancy
+from accountancy._cli import build_common_parser, create_logger, open_output
+
+
+_TOTAL_PRICE_RE = re.compile(r'!(?P<total_price>\d+)')
 
 
 def main() -> None:
     # logger
-    logger = create_logger()
+    logger = create_logger(__name__)
     # option
     option = argument_parser().parse_args()
     if option.verbose:
@@ -35,20 +42,14 @@ class InvalidMarkdownFileError(Exception):
 @dataclasses.dataclass
 class MarkdownFile:
     path: pathlib.Path
+    year: int = dataclasses.field(init=False)
+    month: int = dataclasses.field(init=False)
 
     def __post_init__(self) -> None:
         # resolve
         self.path = self.path.resolve()
         # validation
-        self._validate()
-
-    @property
-    def month(self) -> int:
-        return int(self.path.stem)
-
-    @property
-    def year(self) -> int:
-        return int(self.path.parent.name)
+        self.year, self.month = self._validate()
 
     def receipts(
             self,
@@ -57,62 +58,97 @@ class MarkdownFile:
         logger = logger or logging.getLogger(__name__)
         # open
         logger.debug(f'open: {self.path.as_posix()}')
-        with self.path.open(encoding='utf-8') as file:
-            text = file.read()
-        # parse text
         receipts: list[Receipt] = []
-        for data in re.finditer(
-                r'^\|(?P<day>\d+)'
-                r'\|(?P<hour>\d{2}):(?P<minute>\d{2})'
-                r'\|(?P<store>[^\|]+)'
-                r'\|(.*\|){2}\n'
-                r'(^\|{4}(.*\|){2}\n)*?'
-                r'!(?P<total_price>\d+)',
-                text,
-                flags=re.MULTILINE):
-            logger.debug(f'receipt text: {repr(data.group())}')
-            total_price = int(data.group('total_price'))
-            # parse receipt items
-            items: list[ReceiptItem] = []
-            table = re.sub(r'\n!\d+$', '', data.group()).strip()
-            for row in table.split('\n'):
-                columns = row.split('|')
-                items.append(ReceiptItem(
-                        name=columns[4],
-                        price=int(columns[5])))
-            # receipt
-            receipt = Receipt(
-                    year=self.year,
-                    month=self.month,
-                    day=int(data.group('day')),
-                    hour=int(data.group('hour')),
-                    minute=int(data.group('minute')),
-                    store=data.group('store'),
-                    items=items)
-            logger.info(f'receipt: {receipt}')
-            if receipt.total_price() != total_price:
-                logger.error(
-                        'mismatch total price: '
-                        f'{receipt.store} at {receipt.datetime}')
-            receipts.append(receipt)
+        # rows of the receipt waiting for its total price
+        rows: list[list[str]] = []
+        with self.path.open(encoding='utf-8') as file:
+            for line in file:
+                line = line.removesuffix('\n')
+                columns = line.split('|')
+                # |day|HH:MM|store|item|price|
+                if _is_receipt_key(columns):
+                    rows = [columns]
+                # ||||item|price|
+                elif rows and _is_receipt_item(columns):
+                    rows.append(columns)
+                # !total_price
+                elif rows and (total_match := _TOTAL_PRICE_RE.match(line)):
+                    receipts.append(self._parse_receipt(
+                            rows,
+                            total_match.group(),
+                            logger=logger))
+                    rows = []
+                else:
+                    rows = []
         return receipts
 
-    def _validate(self) -> None:
+    def _parse_receipt(
+            self,
+            rows: list[list[str]],
+            total: str,
+            *,
+            logger: logging.Logger) -> Receipt:
+        text = '\n'.join(['|'.join(row) for row in rows] + [total])
+        logger.debug(f'receipt text: {repr(text)}')
+        total_price = int(total.removeprefix('!'))
+        # parse receipt items
+        item_names = [columns[4] for columns in rows]
+        item_prices = [int(columns[5]) for columns in rows]
+        # receipt
+        key = rows[0]
+        receipt = Receipt(
+                year=self.year,
+                month=self.month,
+                day=int(key[1]),
+                hour=int(key[2][:2]),
+                minute=int(key[2][3:]),
+                store=key[3],
+                item_names=item_names,
+                item_prices=item_prices)
+        logger.info(f'receipt: {receipt}')
+        if receipt.total_price() != total_price:
+            logger.error(
+                    'mismatch total price: '
+                    f'{receipt.store} at {receipt.datetime}')
+        return receipt
+
+    def _validate(self) -> tuple[int, int]:
         # check if the path exists
-        if not self.path.exists():
+        try:
+            mode = self.path.stat().st_mode
+        except (FileNotFoundError, NotADirectoryError) as error:
             raise InvalidMarkdownFileError(
-                    f'"{self.path.as_posix()}" does not exist')
+                    f'"{self.path.as_posix()}" does not exist') from error
         # check if the path is file
-        if not self.path.is_file():
+        if not stat.S_ISREG(mode):
             raise InvalidMarkdownFileError(
                     f'{self.path.as_posix()} is not file')
         # match YYYY/MM.md
-        filename_match = re.search(
-                r'/\d{4}/(0[1-9]|1[0-2])\.md$',
-                self.path.as_posix())
-        if filename_match is None:
+        year_month = accountancy.parse_monthly_report_path(self.path)
+        if year_month is None:
             raise InvalidMarkdownFileError(
                     f'"{self.path.as_posix()}" is not YYYY/MM.md')
+        return year_month
+
+
+def _is_receipt_key(columns: list[str]) -> bool:
+    # |day|HH:MM|store|...|...|
+    if len(columns) < 7 or columns[0] or columns[-1]:
+        return False
+    time = columns[2]
+    return (columns[1].isdecimal()
+            and len(time) == 5
+            and time[2] == ':'
+            and time[:2].isdecimal()
+            and time[3:].isdecimal()
+            and bool(columns[3]))
+
+
+def _is_receipt_item(columns: list[str]) -> bool:
+    # ||||...|...|
+    return (len(columns) >= 7
+            and not any(columns[:4])
+            and not columns[-1])
 
 
 @dataclasses.dataclass
@@ -123,15 +159,17 @@ class ReceiptItem:
 
 @dataclasses.dataclass
 class Receipt:
+    # pylint: disable=too-many-instance-attributes
     year: int
     month: int
     day: int
     hour: int
     minute: int
     store: str
-    items: list[ReceiptItem]
+    item_names: list[str]
+    item_prices: list[int]
 
-    @property
+    @functools.cached_property
     def datetime(self) -> datetime.datetime:
         return datetime.datetime(
                 year=self.year,
@@ -140,48 +178,61 @@ class Receipt:
                 hour=self.hour,
                 minute=self.minute)
 
+    @functools.cached_property
+    def date_text(self) -> str:
+        # YYYY-mm-dd
+        date = self.datetime
+        return f'{date.year:04}-{date.month:02}-{date.day:02}'
+
+    @functools.cached_property
+    def number_text(self) -> str:
+        # YYYYmmddHHMM
+        date = self.datetime
+        return (f'{date.year:04}{date.month:02}{date.day:02}'
+                f'{date.hour:02}{date.minute:02}')
+
+    @property
+    def items(self) -> list[ReceiptItem]:
+        return [
+                ReceiptItem(name=name, price=price)
+                for name, price in zip(self.item_names, self.item_prices)]
+
     def total_price(self) -> int:
-        return sum(item.price for item in self.items)
+        return sum(self.item_prices)
 
 
 def output_as_csv(
         receipts: list[Receipt],
         *,
         path: Optional[pathlib.Path] = None) -> None:
-    records: list[str] = []
+    records: list[tuple[str, str, str, str, int]] = []
     last_number: Optional[str] = None
+    collision_count = 0
     for receipt in receipts:
         # date
-        date = receipt.datetime.strftime('%Y-%m-%d')
-        # number
-        number = receipt.datetime.strftime('%Y%m%d%H%M')
-        if last_number is not None and last_number.startswith(number):
-            number = f'{last_number}#'
-        last_number = number
+        date = receipt.date_text
+        # number ('#' is appended to the receipts in the same minute)
+        number = receipt.number_text
+        if number == last_number:
+            collision_count += 1
+        else:
+            last_number = number
+            collision_count = 0
+        number += '#' * collision_count
         # total place
         total_price = receipt.total_price()
         # date, number, description, account, value
         records.extend([
-                f'{date},{number},{receipt.store},item,{total_price}',
-                f',,,payment,{-total_price}'])
+                (date, number, receipt.store, 'item', total_price),
+                ('', '', '', 'payment', -total_price)])
+    text = io.StringIO()
+    csv.writer(text, lineterminator='\n').writerows(records)
     with open_output(path) as output:
-        for record in records:
-            output.write(f'{record}\n')
-
-
-def create_logger() -> logging.Logger:
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.WARNING)
-    if not logger.hasHandlers():
-        handler = logging.StreamHandler()
-        handler.formatter = logging.Formatter(
-                fmt='%(name)s:%(levelname)s:%(message)s')
-        logger.addHandler(handler)
-    return logger
+        output.write(text.getvalue())
 
 
 def argument_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser()
+    parser = build_common_parser()
     # targets
     parser.add_argument(
             'targets',
@@ -189,32 +240,8 @@ def argument_parser() -> argparse.ArgumentParser:
             metavar='YYYY/MM.md',
             type=pathlib.Path,
             help='target markdown')
-    # verbose
-    parser.add_argument(
-            '-v', '--verbose',
-            action='store_true',
-            help='set log level to debug')
-    # output
-    parser.add_argument(
-            '-o', '--output',
-            type=pathlib.Path,
-            help='output file (default stdout)')
     return parser
 
 
-@contextlib.contextmanager
-def open_output(
-        path: Optional[pathlib.Path] = None) -> Iterator[TextIO]:
-    output = (
-            path.open(mode='w', encoding='utf-8')
-            if path is not None
-            else sys.stdout)
-    try:
-        yield output
-    finally:
-        if path is not None:
-            output.close()
-
-
 if __name__ == '__main__':
     main()